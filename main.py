@@ -1,11 +1,24 @@
 import os
 import time
 import json
-import requests
+import asyncio
+import httpx
+from aiolimiter import AsyncLimiter
 from datetime import datetime
+from functools import lru_cache
 from fastapi import FastAPI
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:  # stdlib fallback
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
 
 app = FastAPI()
 
@@ -15,113 +28,241 @@ SYMBOLS_URL = "https://api.bybit.com/v5/market/instruments-info?category=linear"
 SCAN_INTERVAL = int(os.getenv("SCAN_INTERVAL_SECONDS", 300))  # 5 minutes default
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_MAX_CHARS = 4000  # Telegram caps a message at 4096 characters
 
 MACD_FAST = int(os.getenv("MACD_FAST", 12))
 MACD_SLOW = int(os.getenv("MACD_SLOW", 26))
 MACD_SIGNAL = int(os.getenv("MACD_SIGNAL", 9))
+MACD_PARAMS = [MACD_FAST, MACD_SLOW, MACD_SIGNAL]
+ALPHA_FAST = 2 / (MACD_FAST + 1)
+ALPHA_SLOW = 2 / (MACD_SLOW + 1)
+ALPHA_SIGNAL = 2 / (MACD_SIGNAL + 1)
 
 INTERVALS = {"4h": 240, "1h": 60, "15m": 15}
+COLD_LIMIT = 200  # candles fetched when no EMAs are stored for a symbol/timeframe
+WARM_LIMIT = 5  # candles fetched to advance stored EMAs
 
 STATE_FILE = "state.json"
-MAX_WORKERS = 10  # safe concurrency
+_LAST_SAVED = {"v": None}  # bytes last written to STATE_FILE
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 50))  # in-flight HTTP requests
+# Bybit allows 600 requests per 5 s per IP; stay a little under it.
+BYBIT_MAX_REQUESTS = int(os.getenv("BYBIT_MAX_REQUESTS", 500))
+BYBIT_RATE_PERIOD = float(os.getenv("BYBIT_RATE_PERIOD_SECONDS", 5))
+SYMBOLS_TTL = int(os.getenv("SYMBOLS_TTL_SECONDS", 3600))  # instrument list refresh
+
+_SYM_CACHE = {"t": 0, "v": ()}
+_SYM_LOCK = asyncio.Lock()
+_LIMITER = AsyncLimiter(BYBIT_MAX_REQUESTS, BYBIT_RATE_PERIOD)
+_SEM = asyncio.Semaphore(MAX_CONCURRENCY)
+
+# Shared HTTP/2 client: Bybit requests are multiplexed over a few connections.
+http_pool = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY),
+    timeout=10,
+)
 
 
 # ------------------ Utilities ------------------
 
-def send_telegram(message: str):
+async def send_telegram(message: str):
     if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
         return
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
     payload = {"chat_id": TELEGRAM_CHAT_ID, "text": message}
     try:
-        requests.post(url, json=payload, timeout=10)
+        await http_pool.post(url, json=payload)
     except Exception as e:
         print("Telegram error:", e)
 
 
-def safe_get(url, params=None, retries=3):
+def chunk_messages(messages, limit=TELEGRAM_MAX_CHARS):
+    """Join messages with newlines into as few texts of at most `limit` chars as possible."""
+    chunk = ""
+    for msg in messages:
+        for i in range(0, len(msg), limit):
+            part = msg[i:i + limit]
+            if chunk and len(chunk) + 1 + len(part) > limit:
+                yield chunk
+                chunk = ""
+            chunk = f"{chunk}\n{part}" if chunk else part
+    if chunk:
+        yield chunk
+
+
+async def safe_get(url, params=None, retries=3):
     for attempt in range(retries):
         try:
-            r = requests.get(url, params=params, timeout=10)
+            async with _LIMITER, _SEM:
+                r = await http_pool.get(url, params=params)
             if r.status_code == 200:
-                return r
+                return json_loads(r.content)
             print("HTTP error:", r.status_code, r.text)
         except Exception as e:
             print("Request error:", e)
-        time.sleep(2 * (attempt + 1))
+        await asyncio.sleep(2 * (attempt + 1))
     return None
 
 
-def fetch_symbols():
-    r = safe_get(SYMBOLS_URL)
-    if not r:
-        return []
-    try:
-        data = r.json()
-        return [s["symbol"] for s in data["result"]["list"] if s["quoteCoin"] == "USDT"]
-    except Exception as e:
-        print("Symbol parse error:", e)
-        return []
+async def fetch_symbols():
+    if time.time() - _SYM_CACHE["t"] < SYMBOLS_TTL:
+        return _SYM_CACHE["v"]
+    # Only one concurrent scanner refreshes the list; the others wait for it.
+    async with _SYM_LOCK:
+        if time.time() - _SYM_CACHE["t"] < SYMBOLS_TTL:
+            return _SYM_CACHE["v"]
+        data = await safe_get(SYMBOLS_URL)
+        if not data:
+            return _SYM_CACHE["v"]
+        try:
+            symbols = tuple(s["symbol"] for s in data["result"]["list"] if s["quoteCoin"] == "USDT")
+        except Exception as e:
+            print("Symbol parse error:", e)
+            return _SYM_CACHE["v"]
+        _SYM_CACHE["t"] = time.time()
+        _SYM_CACHE["v"] = symbols
+        return symbols
 
 
-def fetch_ohlcv(symbol, interval, limit=200):
+async def fetch_ohlcv(symbol, interval, limit=COLD_LIMIT):
+    """Return (candle start times, close prices), both oldest-first, or None."""
     params = {"category": "linear", "symbol": symbol, "interval": interval, "limit": limit}
-    r = safe_get(BYBIT_API_URL, params=params)
-    if not r:
-        return pd.DataFrame()
+    data = await safe_get(BYBIT_API_URL, params=params)
+    if not data:
+        return None
     try:
-        data = r.json()
         if "result" not in data or "list" not in data["result"]:
-            return pd.DataFrame()
-        df = pd.DataFrame(data["result"]["list"], columns=["time","open","high","low","close","volume","turnover"])
-        df = df.astype(float)
-        df.sort_values("time", inplace=True)
-        return df
+            return None
+        rows = data["result"]["list"]
+        if not rows:
+            return None
+        # Rows are [time, open, high, low, close, volume, turnover], newest first;
+        # walk them backwards and convert only the time and close columns.
+        times = np.fromiter((row[0] for row in reversed(rows)), dtype=np.int64, count=len(rows))
+        close = np.fromiter((row[4] for row in reversed(rows)), dtype=np.float64, count=len(rows))
+        return times, close
     except Exception as e:
         print("Parse error:", e)
-        return pd.DataFrame()
-
-
-def macd(df):
-    df["ema_fast"] = df["close"].ewm(span=MACD_FAST, adjust=False).mean()
-    df["ema_slow"] = df["close"].ewm(span=MACD_SLOW, adjust=False).mean()
-    df["macd"] = df["ema_fast"] - df["ema_slow"]
-    df["signal"] = df["macd"].ewm(span=MACD_SIGNAL, adjust=False).mean()
-    df["hist"] = df["macd"] - df["signal"]
-    return df
-
-
-def check_first_green(df):
-    if len(df) < 3:
-        return False
-    return df.iloc[-2]["hist"] < 0 and df.iloc[-1]["hist"] > 0
+        return None
+
+
+@lru_cache(maxsize=None)
+def _ema_weights(n):
+    """Weights W (3 x k) such that W @ close[-k:] gives the fast, slow and
+    signal EMAs at the last of n closes.
+
+    Every EMA in the MACD is linear in the closes (pandas' adjust=False
+    recursion, seeded with the first value), so the recursion is run once
+    per series length on unit vectors instead of once per symbol on prices.
+    Leading columns whose weights are all below 1e-12 are dropped.
+    """
+    eye = np.eye(n)
+    ema_fast = eye[0]
+    ema_slow = eye[0]
+    signal = np.zeros(n)
+    for t in range(1, n):
+        ema_fast = ALPHA_FAST * eye[t] + (1 - ALPHA_FAST) * ema_fast
+        ema_slow = ALPHA_SLOW * eye[t] + (1 - ALPHA_SLOW) * ema_slow
+        signal = ALPHA_SIGNAL * (ema_fast - ema_slow) + (1 - ALPHA_SIGNAL) * signal
+    w = np.vstack([ema_fast, ema_slow, signal])
+    k = n - int(np.argmax(np.abs(w).max(axis=0) >= 1e-12))
+    return np.ascontiguousarray(w[:, -k:])
+
+
+def ema_cold(close):
+    """(fast, slow, signal) EMAs at the last of `close`, computed from scratch."""
+    w = _ema_weights(len(close))
+    return tuple(float(v) for v in w @ close[-w.shape[1]:])
+
+
+def ema_advance(ema, closes):
+    """Feed new closes (oldest first) into stored (fast, slow, signal) EMAs."""
+    ef, es, esig = ema
+    for x in closes:
+        ef += ALPHA_FAST * (x - ef)
+        es += ALPHA_SLOW * (x - es)
+        esig += ALPHA_SIGNAL * (ef - es - esig)
+    return ef, es, esig
+
+
+def macd_first_green(ema, last_close):
+    """True if the MACD histogram turns positive on `last_close` after being
+    negative at `ema`, the EMAs of the previous candle."""
+    ef, es, esig = ema
+    prev = ef - es - esig
+    ef, es, esig = ema_advance(ema, [last_close])
+    return prev < 0 and ef - es - esig > 0
+
+
+async def check_first_green(symbol, tf, state):
+    """Fetch `tf` klines for `symbol` and test for a first green histogram bar.
+
+    EMAs up to the last closed candle are kept in state under
+    "{symbol}-{tf}-ema". While they are recent enough to fall inside a
+    WARM_LIMIT-candle window, scans fetch only that window and fold in the
+    candles closed since; otherwise they go straight to a cold fetch.
+    Returns (first_green, start time of the latest candle), or None if the
+    klines could not be fetched.
+    """
+    key = f"{symbol}-{tf}-ema"
+    saved = state.get(key)
+    ema = None
+    warm_window_ms = (WARM_LIMIT - 1) * INTERVALS[tf] * 60_000
+    if saved and saved.get("p") == MACD_PARAMS and time.time() * 1000 - saved["t"] < warm_window_ms:
+        ohlcv = await fetch_ohlcv(symbol, INTERVALS[tf], limit=WARM_LIMIT)
+        if ohlcv is None:
+            return None
+        times, close = ohlcv
+        # The newest candle is still forming; only closed ones are folded in.
+        idx = np.flatnonzero(times[:-1] == saved["t"])
+        if idx.size:
+            ema = ema_advance((saved["ef"], saved["es"], saved["esig"]), close[idx[0] + 1:-1].tolist())
+
+    if ema is None:  # nothing usable stored
+        ohlcv = await fetch_ohlcv(symbol, INTERVALS[tf], limit=COLD_LIMIT)
+        if ohlcv is None:
+            return None
+        times, close = ohlcv
+        if len(close) < 3:
+            return False, int(times[-1])
+        ema = ema_cold(close[:-1])
+
+    state[key] = {"t": int(times[-2]), "ef": ema[0], "es": ema[1], "esig": ema[2], "p": MACD_PARAMS}
+    return macd_first_green(ema, float(close[-1])), int(times[-1])
 
 
 def load_state():
     if os.path.exists(STATE_FILE):
-        with open(STATE_FILE, "r") as f:
-            return json.load(f)
+        with open(STATE_FILE, "rb") as f:
+            return json_loads(f.read())
     return {}
 
 
 def save_state(state):
-    with open(STATE_FILE, "w") as f:
-        json.dump(state, f)
+    data = json_dumps(state)
+    if data == _LAST_SAVED["v"]:
+        return
+    # Write to a temp file and swap it in so a kill mid-write can't corrupt state.
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, STATE_FILE)
+    _LAST_SAVED["v"] = data
 
 
 # ------------------ Scanner ------------------
 
-def process_symbol(symbol, state, force_run=False):
+async def process_symbol(symbol, state, force_run=False):
+    # Updates the shared state in place; only this symbol's keys are touched.
     results = []
-    df4h = fetch_ohlcv(symbol, INTERVALS["4h"])
-    if df4h.empty:
-        return state, results
+    res4h = await check_first_green(symbol, "4h", state)
+    if res4h is None:
+        return results
 
-    df4h = macd(df4h)
-    if check_first_green(df4h):
+    first_green, candle_time = res4h
+    if first_green:
         key = f"{symbol}-4h"
         last_time = state.get(key, 0)
-        candle_time = int(df4h.iloc[-1]["time"])
 
         if last_time != candle_time or force_run:
             msg = f"⚡ Signal: {symbol} → First Green MACD Histogram on 4H"
@@ -131,11 +272,8 @@ def process_symbol(symbol, state, force_run=False):
         else:
             alignment = []
             for tf in ["1h", "15m"]:
-                dft = fetch_ohlcv(symbol, INTERVALS[tf])
-                if dft.empty:
-                    continue
-                dft = macd(dft)
-                if check_first_green(dft):
+                res = await check_first_green(symbol, tf, state)
+                if res and res[0]:
                     alignment.append(tf)
 
             if alignment and not state.get(f"{symbol}-4h-strong", False):
@@ -145,60 +283,78 @@ def process_symbol(symbol, state, force_run=False):
     else:
         state.pop(f"{symbol}-4h-strong", None)
 
-    return state, results
+    return results
 
 
-def scanner(force_run=False):
+async def scanner(force_run=False):
     state = load_state()
-    symbols = fetch_symbols()
+    symbols = await fetch_symbols()
     if not symbols:
         print("No symbols fetched.")
         return
 
+    # Drop stored EMAs of delisted symbols so state.json doesn't grow forever.
+    live = set(symbols)
+    for key in [k for k in state if k.endswith("-ema") and k.rsplit("-", 2)[0] not in live]:
+        del state[key]
+
     print(f"Scanning {len(symbols)} symbols...")
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = {executor.submit(process_symbol, symbol, state.copy(), force_run): symbol for symbol in symbols}
-        for future in as_completed(futures):
-            try:
-                new_state, results = future.result()
-                state.update(new_state)
-                for msg in results:
-                    send_telegram(msg)
-            except Exception as e:
-                print("Symbol error:", futures[future], e)
+    outcomes = await asyncio.gather(
+        *[process_symbol(symbol, state, force_run) for symbol in symbols],
+        return_exceptions=True,
+    )
+    all_msgs = []
+    for symbol, outcome in zip(symbols, outcomes):
+        if isinstance(outcome, Exception):
+            print("Symbol error:", symbol, outcome)
+            continue
+        all_msgs.extend(outcome)
 
     save_state(state)
+    for text in chunk_messages(all_msgs):
+        await send_telegram(text)
 
 
 # ------------------ Background ------------------
 
+async def loop():
+    while True:
+        try:
+            await scanner()
+        except Exception as e:
+            print("Error in scanner:", e)
+        await asyncio.sleep(SCAN_INTERVAL)
+
+
+async def pinger():
+    url = os.getenv("SELF_URL")
+    if not url:
+        return
+    while True:
+        try:
+            await http_pool.get(url)
+            print("Self-pinged", url)
+        except Exception as e:
+            print("Ping error:", e)
+        await asyncio.sleep(300)
+
+
 @app.on_event("startup")
-def start_loop():
-    import threading
-
-    threading.Thread(target=lambda: scanner(force_run=True), daemon=True).start()
-
-    def loop():
-        while True:
-            try:
-                scanner()
-            except Exception as e:
-                print("Error in scanner:", e)
-            time.sleep(SCAN_INTERVAL)
-    threading.Thread(target=loop, daemon=True).start()
-
-    def pinger():
-        url = os.getenv("SELF_URL")
-        if not url:
-            return
-        while True:
-            try:
-                requests.get(url, timeout=10)
-                print("Self-pinged", url)
-            except Exception as e:
-                print("Ping error:", e)
-            time.sleep(300)
-    threading.Thread(target=pinger, daemon=True).start()
+async def start_loop():
+    app.state.tasks = [
+        asyncio.create_task(scanner(force_run=True)),
+        asyncio.create_task(loop()),
+        asyncio.create_task(pinger()),
+    ]
+
+
+@app.on_event("shutdown")
+async def stop_loop():
+    # Cancel at an await point; save_state never awaits, so state.json stays whole.
+    for task in app.state.tasks:
+        task.cancel()
+    await asyncio.gather(*app.state.tasks, return_exceptions=True)
+    await http_pool.aclose()
 
 
 @app.api_route("/", methods=["GET", "HEAD"])
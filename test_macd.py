@@ -0,0 +1,91 @@
+import asyncio
+
+import numpy as np
+
+import main
+
+
+def reference_hist(close):
+    """MACD histogram via the plain adjust=False EMA recursion (as pandas' ewm)."""
+    def ema(xs, span):
+        alpha = 2 / (span + 1)
+        out = [xs[0]]
+        for x in xs[1:]:
+            out.append(alpha * x + (1 - alpha) * out[-1])
+        return out
+
+    fast = ema(close, main.MACD_FAST)
+    slow = ema(close, main.MACD_SLOW)
+    macd_line = [f - s for f, s in zip(fast, slow)]
+    signal = ema(macd_line, main.MACD_SIGNAL)
+    return [m - s for m, s in zip(macd_line, signal)]
+
+
+def random_walk(rng, n):
+    return (100 + np.cumsum(rng.normal(size=n))).tolist()
+
+
+def stub_klines(monkeypatch, close, step_ms):
+    """Serve the first `end[0]` candles of `close` and record requested limits."""
+    times = np.arange(len(close), dtype=np.int64) * step_ms
+    prices = np.asarray(close, dtype=np.float64)
+    end = [0]
+    limits = []
+
+    async def fetch_ohlcv(symbol, interval, limit=main.COLD_LIMIT):
+        limits.append(limit)
+        start = max(0, end[0] - limit)
+        return times[start:end[0]].copy(), prices[start:end[0]].copy()
+
+    monkeypatch.setattr(main, "fetch_ohlcv", fetch_ohlcv)
+    # "Now" is just after the newest candle opened.
+    monkeypatch.setattr(main.time, "time", lambda: (times[end[0] - 1] + 1) / 1000)
+    return end, limits
+
+
+def test_cold_path_matches_reference():
+    rng = np.random.default_rng(0)
+    greens = 0
+    for _ in range(300):
+        close = random_walk(rng, main.COLD_LIMIT)
+        hist = reference_hist(close)
+        ema = main.ema_cold(np.asarray(close[:-1]))
+        ef, es, esig = ema
+        assert abs((ef - es - esig) - hist[-2]) < 1e-9
+        expected = hist[-2] < 0 < hist[-1]
+        assert main.macd_first_green(ema, close[-1]) == expected
+        greens += expected
+    assert greens > 0
+
+
+def test_warm_start_matches_reference(monkeypatch):
+    rng = np.random.default_rng(1)
+    close = random_walk(rng, 1500)
+    step_ms = main.INTERVALS["4h"] * 60_000
+    end, limits = stub_klines(monkeypatch, close, step_ms)
+
+    state = {}
+    first = 300
+    greens = 0
+    for end[0] in range(first, len(close), 2):
+        first_green, _ = asyncio.run(main.check_first_green("X", "4h", state))
+        # The cold fetch seeds the EMAs at its first candle; compare from there.
+        hist = reference_hist(close[first - main.COLD_LIMIT:end[0]])
+        assert first_green == (hist[-2] < 0 < hist[-1])
+        greens += first_green
+    assert greens > 0
+    assert limits[0] == main.COLD_LIMIT
+    assert set(limits[1:]) == {main.WARM_LIMIT}
+
+
+def test_stale_state_goes_straight_to_cold_fetch(monkeypatch):
+    rng = np.random.default_rng(2)
+    close = random_walk(rng, 600)
+    end, limits = stub_klines(monkeypatch, close, main.INTERVALS["1h"] * 60_000)
+
+    state = {}
+    end[0] = 250
+    asyncio.run(main.check_first_green("X", "1h", state))
+    end[0] = 250 + main.WARM_LIMIT + 10
+    asyncio.run(main.check_first_green("X", "1h", state))
+    assert limits == [main.COLD_LIMIT, main.COLD_LIMIT]